@@ -15,7 +15,9 @@ limitations under the License.
 
 # Standard Library
 from dataclasses import dataclass
-from typing import List, Set, Union
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 # Third Party
 import numpy as np
@@ -42,6 +44,14 @@ from .types import (
 
 logger = get_logger(__name__)
 
+# buffer key -> (number of channels, dtype) of the shared memory slabs
+_SHARED_BUFFER_FORMATS = {
+    "rgb": (3, "uint8"),
+    "normals": (3, "uint8"),
+    "depth": (1, "float32"),
+    "binary_mask": (1, "bool"),
+}
+
 
 @dataclass
 class SceneData:
@@ -50,6 +60,19 @@ class SceneData:
     object_datas: List[Panda3dObjectData]
 
 
+@dataclass
+class SharedBufferSpec:
+    """Description of a shared memory slab of shape (bsz, h, w, c).
+
+    Only the name of the shared memory block travels through the queues,
+    workers attach to it once and then write their renderings in place.
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
 @dataclass
 class RenderArguments:
     data_id: int
@@ -57,6 +80,21 @@ class RenderArguments:
     render_depth: bool
     render_binary_mask: bool
     scene_data: SceneData
+    shared_buffers: Optional[Dict[str, SharedBufferSpec]] = None
+
+
+def attach_shared_buffer(spec: SharedBufferSpec) -> SharedMemory:
+    shm = SharedMemory(name=spec.name)
+    # The parent process owns the block and is responsible for unlinking it,
+    # prevent the resource tracker of the worker from doing it at exit.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def shared_buffer_view(spec: SharedBufferSpec, shm: SharedMemory) -> np.ndarray:
+    # Views are created on demand and never stored: a block can only be
+    # closed once no numpy array references its buffer anymore.
+    return np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=shm.buf)
 
 
 def worker_loop(
@@ -71,6 +109,8 @@ def worker_loop(
         asset_dataset=object_dataset,
         preload_labels=preload_labels,
     )
+    # buffer key -> (spec, shared memory block)
+    attached_buffers: Dict[str, Tuple[SharedBufferSpec, SharedMemory]] = {}
 
     while True:
         render_args: Union[RenderArguments, None] = in_queue.get()
@@ -88,7 +128,8 @@ def worker_loop(
             # Set copy_arrays=True so that the numpy
             # arrays are contiguous. This ensures that they
             # have non-negative strides and can be converted into
-            # torch.tensors.
+            # torch.tensors. Not needed with shared buffers since the
+            # renderings are copied into the shared slabs anyway.
             renderings = renderer.render_scene(
                 object_datas=scene_data.object_datas,
                 camera_datas=[scene_data.camera_data],
@@ -96,7 +137,7 @@ def worker_loop(
                 render_normals=render_args.render_normals,
                 render_depth=render_args.render_depth,
                 render_binary_mask=render_args.render_binary_mask,
-                copy_arrays=True,  # ensures non-negative strid
+                copy_arrays=render_args.shared_buffers is None,
             )
             # by definition, each "scene" in batch rendering corresponds to 1 camera, 1 object
             # -> retrieves the first and only rendering
@@ -110,18 +151,40 @@ def worker_loop(
                 binary_mask=np.zeros((h, w, 1), dtype=bool),
             )
 
-        output = WorkerRenderOutput(
-            data_id=render_args.data_id,
-            rgb=renderings_.rgb,
-            normals=renderings_.normals if render_args.render_normals else None,
-            depth=renderings_.depth if render_args.render_depth else None,
-            binary_mask=renderings_.binary_mask
-            if render_args.render_binary_mask
-            else None,
-        )
+        if render_args.shared_buffers is not None:
+            # Write the renderings directly in the slot data_id of the shared
+            # slabs and only send back a completion message.
+            data_id = render_args.data_id
+            for key, spec in render_args.shared_buffers.items():
+                if key not in attached_buffers or attached_buffers[key][0] != spec:
+                    if key in attached_buffers:
+                        attached_buffers.pop(key)[1].close()
+                    attached_buffers[key] = (spec, attach_shared_buffer(spec))
+                view = shared_buffer_view(*attached_buffers[key])
+                view[data_id] = getattr(renderings_, key)
+                del view
+            output = WorkerRenderOutput(
+                data_id=data_id,
+                rgb=None,
+                normals=None,
+                depth=None,
+                binary_mask=None,
+            )
+        else:
+            output = WorkerRenderOutput(
+                data_id=render_args.data_id,
+                rgb=renderings_.rgb,
+                normals=renderings_.normals if render_args.render_normals else None,
+                depth=renderings_.depth if render_args.render_depth else None,
+                binary_mask=renderings_.binary_mask
+                if render_args.render_binary_mask
+                else None,
+            )
         del render_args
         out_queue.put(output)
 
+    for _, shm in attached_buffers.values():
+        shm.close()
     logger.debug(f"Close worker: {worker_id}")
 
 
@@ -132,11 +195,22 @@ class Panda3dBatchRenderer:
         n_workers: int = 8,
         preload_cache: bool = True,
         split_objects: bool = False,
+        shared_memory: bool = False,
     ):
+        """
+        Args:
+        ----
+            shared_memory (bool): if True, the workers write their renderings
+                in preallocated shared memory slabs indexed by data_id instead
+                of sending the images through the output queue.
+        """
         self._is_closed = False
         self._object_dataset = asset_dataset
         self._n_workers = n_workers
         self._split_objects = split_objects
+        self._shared_memory = shared_memory
+        # buffer key -> (spec, shared memory block) of the slabs
+        self._shared_buffers: Dict[str, Tuple[SharedBufferSpec, SharedMemory]] = {}
         self._renderers = []
         self._in_queues = []
         self._out_queue = None
@@ -208,6 +282,15 @@ class Panda3dBatchRenderer:
         scene_datas = self.make_scene_data(labels, TCO, K, light_datas, resolution)
         bsz = len(scene_datas)
 
+        if self._shared_memory:
+            return self._render_shared_memory(
+                scene_datas,
+                resolution,
+                render_normals=render_normals,
+                render_depth=render_depth,
+                render_binary_mask=render_binary_mask,
+            )
+
         # ==================================
         # Send batches of renders to workers
         # ==================================
@@ -288,6 +371,95 @@ class Panda3dBatchRenderer:
             binary_masks=binary_masks,
         )
 
+    def _get_shared_buffers(
+        self,
+        bsz: int,
+        resolution: Resolution,
+        keys: List[str],
+    ) -> Dict[str, SharedBufferSpec]:
+        """Return the specs of the shared slabs, (re)allocating them if needed.
+
+        The slabs are only reallocated when the batch size exceeds their
+        capacity or when the resolution changes.
+        """
+        h, w = resolution
+        specs = {}
+        for key in keys:
+            channels, dtype = _SHARED_BUFFER_FORMATS[key]
+            if key in self._shared_buffers:
+                spec, shm = self._shared_buffers[key]
+                if spec.shape[0] >= bsz and spec.shape[1:3] == (h, w):
+                    specs[key] = spec
+                    continue
+                del self._shared_buffers[key]
+                shm.close()
+                shm.unlink()
+            shape = (bsz, h, w, channels)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            shm = SharedMemory(create=True, size=nbytes)
+            spec = SharedBufferSpec(name=shm.name, shape=shape, dtype=dtype)
+            self._shared_buffers[key] = (spec, shm)
+            specs[key] = spec
+        return specs
+
+    def _render_shared_memory(
+        self,
+        scene_datas: List[SceneData],
+        resolution: Resolution,
+        render_normals: bool,
+        render_depth: bool,
+        render_binary_mask: bool,
+    ) -> BatchRenderOutput:
+        bsz = len(scene_datas)
+        keys = ["rgb"]
+        if render_normals:
+            keys.append("normals")
+        if render_depth:
+            keys.append("depth")
+        if render_binary_mask:
+            keys.append("binary_mask")
+        specs = self._get_shared_buffers(bsz, resolution, keys)
+
+        for n, scene_data_n in enumerate(scene_datas):
+            render_args = RenderArguments(
+                data_id=n,
+                scene_data=scene_data_n,
+                render_normals=render_normals,
+                render_depth=render_depth,
+                render_binary_mask=render_binary_mask,
+                shared_buffers=specs,
+            )
+            in_queue = self._object_label_to_queue[scene_data_n.object_datas[0].label]
+            in_queue.put(render_args)
+
+        # Workers only send back completion messages, the images are already
+        # in the shared slabs.
+        for _ in range(bsz):
+            self._out_queue.get()
+
+        def get_batch(key: str) -> torch.Tensor:
+            # The slabs are reused by the next call: the returned tensors
+            # must not alias them.
+            view = shared_buffer_view(*self._shared_buffers[key])
+            batch = torch.from_numpy(view[:bsz])
+            if torch.cuda.is_available():
+                batch = batch.cuda()
+            elif batch.dtype in (torch.float32, torch.bool):
+                batch = batch.clone()
+            return batch.permute(0, 3, 1, 2)
+
+        rgbs = get_batch("rgb").float() / 255
+        normals = get_batch("normals").float() / 255 if render_normals else None
+        depths = get_batch("depth").float() if render_depth else None
+        binary_masks = get_batch("binary_mask") if render_binary_mask else None
+
+        return BatchRenderOutput(
+            rgbs=rgbs,
+            normals=normals,
+            depths=depths,
+            binary_masks=binary_masks,
+        )
+
     def _init_renderers(self, preload_cache: bool) -> None:
         object_labels = [obj.label for obj in self._object_dataset.list_objects]
 
@@ -345,6 +517,10 @@ class Panda3dBatchRenderer:
             queue.close()
         if self._out_queue is not None:
             self._out_queue.close()
+        for _, shm in self._shared_buffers.values():
+            shm.close()
+            shm.unlink()
+        self._shared_buffers = {}
         self._is_closed = True
         logger.debug("Batch renderer is closed.")
 